@@ -1,27 +1,35 @@
 import os
 import re
-import json
 import base64
+import hashlib
 import asyncio
 import logging
 import secrets
+import ssl
+import tempfile
+import time
 import datetime
+import functools
 from typing import Optional, Dict, Any, List
 from zoneinfo import ZoneInfo
 
 import aiohttp
+import orjson
 from fastapi import FastAPI, Request, HTTPException, Depends, Query, Form, Cookie, Path
-from fastapi.responses import JSONResponse, RedirectResponse, HTMLResponse, StreamingResponse
+from fastapi.responses import ORJSONResponse, RedirectResponse, HTMLResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache
 from pydantic import BaseModel
 from pyrogram import Client, filters
 from pyrogram.types import Message, InputMediaAudio, InputMediaVideo
 from pyrogram.enums import ParseMode
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel, ReturnDocument, WriteConcern
+from pymongo.errors import OperationFailure
 from Crypto.Cipher import AES
-from Crypto.Util.Padding import unpad
 import humanize
+from cachetools import TTLCache
 
 # -------------------
 # Basic logger setup
@@ -43,18 +51,20 @@ MONGO_DB_URI = os.getenv("MONGO_DB_URI")
 ADMIN_SECRET = os.getenv("ADMIN_SECRET")
 DEFAULT_VIDEO_QUALITY = os.getenv("DEFAULT_VIDEO_QUALITY", "720")
 DEFAULT_AUDIO_QUALITY = os.getenv("DEFAULT_AUDIO_QUALITY", "320")
-DOWNLOAD_DIR = os.getenv("DOWNLOAD_DIR", "./downloads")
 SAVETUBE_BASE = "https://media.savetube.me"
 WEBSITE_URL = os.getenv("WEBSITE_URL", "https://chacheapi-21117ae61e3f.herokuapp.com")
+MEMORY_CACHE_SIZE = int(os.getenv("MEMORY_CACHE_SIZE", "10000"))
+MEMORY_CACHE_TTL = int(os.getenv("MEMORY_CACHE_TTL", "3600"))
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
 
 # Validate required environment variables
 if not all([API_ID, API_HASH, BOT_TOKEN, CACHE_CHANNEL_ID, MONGO_DB_URI, ADMIN_SECRET]):
     logger.error("Missing required environment variables")
     raise RuntimeError("Please set all required environment variables")
 
-os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 os.makedirs("static", exist_ok=True)
 os.makedirs("templates", exist_ok=True)
+os.makedirs(".jinja_cache", exist_ok=True)
 
 # -------------------
 # MongoDB connection
@@ -62,6 +72,10 @@ os.makedirs("templates", exist_ok=True)
 try:
     mongo_client = AsyncIOMotorClient(MONGO_DB_URI)
     mongodb = mongo_client.yt_api
+    # Key creation is not critical enough to wait for a journal flush
+    apikeys_unjournaled = mongodb.get_collection(
+        "apikeys", write_concern=WriteConcern(w=1, j=False)
+    )
     logger.info("Connected to MongoDB successfully")
 except Exception as e:
     logger.error(f"Failed to connect to MongoDB: {e}")
@@ -70,9 +84,26 @@ except Exception as e:
 # -------------------
 # FastAPI setup with templates
 # -------------------
-app = FastAPI(title="YouTube Downloader Pro - Premium 3D Admin Panel")
-app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
+app = FastAPI(
+    title="YouTube Downloader Pro - Premium 3D Admin Panel",
+    default_response_class=ORJSONResponse
+)
+HASHED_ASSET_RE = re.compile(r"\.[0-9a-f]{8,}\.[A-Za-z0-9]+$")
+
+class CachedStaticFiles(StaticFiles):
+    # Fingerprinted assets (name.<hash>.ext) never change, so let browsers keep them
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if HASHED_ASSET_RE.search(str(full_path)):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
+templates = Jinja2Templates(
+    directory="templates",
+    bytecode_cache=FileSystemBytecodeCache(".jinja_cache"),
+    auto_reload=False
+)
 
 # -------------------
 # Pyrogram client
@@ -89,14 +120,29 @@ pyrogram_client = Client(
 # Constants and utilities
 # -------------------
 YT_RE = re.compile(
-    r'(?:https?://)?(?:www\.)?(?:youtube\.com/(?:watch\?v=|embed/|shorts/)|youtu\.be/)?([0-9A-Za-z_-]{11})'
+    r'(?:https?://)?(?:www\.)?(?:youtube\.com/(?:watch\?v=|embed/|shorts/)|youtu\.be/)?([0-9A-Za-z_-]{11})',
+    re.ASCII
 )
+_VIDID_RE = re.compile(r"[0-9A-Za-z_-]{11}")
+_SANITIZE_RE = re.compile(r'[^\w\-_\. ]')
 
 AES_HEX_KEY = "C5D58EF67A7584E4A29F6C35BBC4EB12"
 AES_KEY_BYTES = bytes.fromhex(AES_HEX_KEY)
+# Key is constant, so expand it once; CBC chaining is applied by hand per call
+_AES_ECB = AES.new(AES_KEY_BYTES, AES.MODE_ECB)
 
-IN_MEMORY_CACHE: Dict[str, Dict[str, Any]] = {}
+IN_MEMORY_CACHE: TTLCache = TTLCache(maxsize=MEMORY_CACHE_SIZE, ttl=MEMORY_CACHE_TTL)
 PROCESSING_SET = set()
+PROCESSING_TASKS: Dict[str, asyncio.Task] = {}
+INFLIGHT: Dict[str, asyncio.Future] = {}
+UPLOADING: Dict[str, dict] = {}
+UPLOAD_SEM = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+CACHE_LOOKUPS: Dict[str, asyncio.Future] = {}
+
+CDN_CACHE_TTL = 60
+CDN_FAILURE_BACKOFF = 10
+_CDN_CACHE: Dict[str, Any] = {"cdn": None, "ts": 0.0}
+_CDN_LOCK = asyncio.Lock()
 
 # -------------------
 # Authentication functions
@@ -116,10 +162,8 @@ async def get_current_admin(api_key: str = Cookie(None)):
 # -------------------
 # Premium 3D HTML Templates
 # -------------------
-def create_premium_templates():
-    # Base template with 3D effects and premium design
-    with open("templates/base.html", "w") as f:
-        f.write("""<!DOCTYPE html>
+# Base template with 3D effects and premium design
+BASE_TEMPLATE = """<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -262,11 +306,10 @@ def create_premium_templates():
         setInterval(updateRealTimeStats, 30000);
     </script>
 </body>
-</html>""")
+</html>"""
 
-    # Home page with premium design
-    with open("templates/index.html", "w") as f:
-        f.write("""{% extends "base.html" %}
+# Home page with premium design
+INDEX_TEMPLATE = """{% extends "base.html" %}
 
 {% block content %}
 <div class="container py-5">
@@ -385,11 +428,10 @@ def create_premium_templates():
         </div>
     </div>
 </div>
-{% endblock %}""")
+{% endblock %}"""
 
-    # Admin Panel with 3D effects
-    with open("templates/admin.html", "w") as f:
-        f.write("""{% extends "base.html" %}
+# Admin Panel with 3D effects
+ADMIN_TEMPLATE = """{% extends "base.html" %}
 
 {% block content %}
 <div class="container-fluid py-4">
@@ -487,6 +529,10 @@ def create_premium_templates():
                         <input type="number" name="days_valid" class="form-control bg-dark text-white border-0" 
                                placeholder="Days Valid" value="30" required>
                     </div>
+                    <div class="mb-3">
+                        <input type="number" name="count" class="form-control bg-dark text-white border-0" 
+                               placeholder="Number of Keys" value="1" min="1" max="1000">
+                    </div>
                     <div class="mb-3 form-check">
                         <input type="checkbox" name="is_admin" class="form-check-input" id="isAdmin">
                         <label class="form-check-label" for="isAdmin">Admin Privileges</label>
@@ -581,59 +627,130 @@ def create_premium_templates():
         }
     }
 </script>
-{% endblock %}""")
+{% endblock %}"""
+
+PREMIUM_TEMPLATES = {
+    "base.html": BASE_TEMPLATE,
+    "index.html": INDEX_TEMPLATE,
+    "admin.html": ADMIN_TEMPLATE
+}
+
+def create_premium_templates():
+    # Only (re)write templates whose on-disk content differs, so restarts and
+    # extra workers don't rewrite identical files
+    for name, content in PREMIUM_TEMPLATES.items():
+        path = os.path.join("templates", name)
+        data = content.encode()
+        try:
+            with open(path, "rb") as f:
+                if f.read() == data:
+                    continue
+        except FileNotFoundError:
+            pass
+        
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
 
-# Create the templates
-create_premium_templates()
+def warm_templates():
+    # Compile every template up front so the first request doesn't pay for it
+    for name in templates.env.list_templates():
+        try:
+            templates.env.get_template(name)
+        except Exception as e:
+            logger.error(f"Failed to compile template {name}: {e}")
 
 # -------------------
 # Helper functions
 # -------------------
+IST = ZoneInfo("Asia/Kolkata")
+_LAST_IST: Dict[str, Any] = {"date": "", "expires_at": 0.0}
+
 def ist_date_str() -> str:
-    now_ist = datetime.datetime.now(ZoneInfo("Asia/Kolkata"))
-    return now_ist.strftime("%Y-%m-%d")
+    # The date only changes at IST midnight, so reuse it until then
+    if time.time() < _LAST_IST["expires_at"]:
+        return _LAST_IST["date"]
+    
+    now_ist = datetime.datetime.now(IST)
+    next_midnight = datetime.datetime.combine(
+        now_ist.date() + datetime.timedelta(days=1), datetime.time(), tzinfo=IST
+    )
+    _LAST_IST["date"] = now_ist.strftime("%Y-%m-%d")
+    _LAST_IST["expires_at"] = next_midnight.timestamp()
+    return _LAST_IST["date"]
+
+def _cbc_decrypt(data: memoryview) -> bytes:
+    # data is IV || ciphertext; P_i = D(C_i) xor C_{i-1}, with C_0 = IV
+    size = len(data) - 16
+    if size <= 0 or size % 16:
+        raise ValueError("Ciphertext length must be a non-zero multiple of 16")
+    block = bytearray(size)
+    _AES_ECB.decrypt(data[16:], output=block)
+    chain = int.from_bytes(data[:-16], "big")
+    return (int.from_bytes(block, "big") ^ chain).to_bytes(size, "big")
 
 def decrypt_savetube_data(b64_encrypted: str) -> dict:
     try:
-        raw = base64.b64decode(b64_encrypted)
-        iv = raw[:16]
-        ciphertext = raw[16:]
-        cipher = AES.new(AES_KEY_BYTES, AES.MODE_CBC, iv=iv)
-        decrypted = cipher.decrypt(ciphertext)
-        unpadded = unpad(decrypted, 16, style='pkcs7')
-        return json.loads(unpadded.decode())
+        raw = memoryview(base64.b64decode(b64_encrypted))
+        decrypted = _cbc_decrypt(raw)
+        pad = decrypted[-1]
+        if not 1 <= pad <= 16 or decrypted[-pad:] != bytes((pad,)) * pad:
+            raise ValueError("Padding is incorrect.")
+        return orjson.loads(decrypted[:-pad])
     except Exception as e:
         logger.error(f"Decryption failed: {e}")
         raise
 
+def _strip_if_needed(inp: str) -> str:
+    # Avoid allocating a new string when there is nothing to strip
+    if inp[:1].isspace() or inp[-1:].isspace():
+        return inp.strip()
+    return inp
+
+@functools.lru_cache(maxsize=4096)
 def normalize_youtube_input(inp: str) -> str:
-    inp = inp.strip()
-    m = YT_RE.search(inp)
-    if m:
-        vidid = m.group(1)
+    vidid = extract_vidid(inp)
+    if vidid:
         return f"https://www.youtube.com/watch?v={vidid}"
-    if re.fullmatch(r"[0-9A-Za-z_-]{11}", inp):
-        return f"https://www.youtube.com/watch?v={inp}"
-    return inp
+    return _strip_if_needed(inp)
 
+@functools.lru_cache(maxsize=4096)
 def extract_vidid(inp: str) -> Optional[str]:
-    m = YT_RE.search(inp.strip())
+    inp = _strip_if_needed(inp)
+    # Bare video IDs are the common case; skip the URL regex for them
+    if len(inp) == 11 and _VIDID_RE.fullmatch(inp):
+        return inp
+    m = YT_RE.search(inp)
     if m:
         return m.group(1)
-    if re.fullmatch(r"[0-9A-Za-z_-]{11}", inp.strip()):
-        return inp.strip()
     return None
 
 def sanitize_filename(name: str) -> str:
-    return re.sub(r'[^\w\-_\. ]', '_', name)
+    return _SANITIZE_RE.sub('_', name)
 
 async def get_random_cdn(session: aiohttp.ClientSession) -> str:
-    try:
-        async with session.get(f"{SAVETUBE_BASE}/api/random-cdn", timeout=10) as r:
-            js = await r.json()
-            return js.get("cdn", "cdn1.savetube.me")
-    except Exception:
-        return "cdn1.savetube.me"
+    # Reuse the last CDN for CDN_CACHE_TTL seconds instead of asking on every call
+    if _CDN_CACHE["cdn"] and time.monotonic() - _CDN_CACHE["ts"] < CDN_CACHE_TTL:
+        return _CDN_CACHE["cdn"]
+    
+    async with _CDN_LOCK:
+        if _CDN_CACHE["cdn"] and time.monotonic() - _CDN_CACHE["ts"] < CDN_CACHE_TTL:
+            return _CDN_CACHE["cdn"]
+        
+        try:
+            async with session.get(f"{SAVETUBE_BASE}/api/random-cdn", timeout=10) as r:
+                js = orjson.loads(await r.read())
+                cdn = js.get("cdn", "cdn1.savetube.me")
+        except Exception:
+            # Back off before retrying so queued callers don't each repeat the failing lookup
+            _CDN_CACHE["cdn"] = _CDN_CACHE["cdn"] or "cdn1.savetube.me"
+            _CDN_CACHE["ts"] = time.monotonic() - CDN_CACHE_TTL + CDN_FAILURE_BACKOFF
+            return _CDN_CACHE["cdn"]
+        
+        _CDN_CACHE["cdn"] = cdn
+        _CDN_CACHE["ts"] = time.monotonic()
+        return cdn
 
 async def savetube_info(session: aiohttp.ClientSession, youtube_url: str) -> dict:
     cdn = await get_random_cdn(session)
@@ -641,7 +758,7 @@ async def savetube_info(session: aiohttp.ClientSession, youtube_url: str) -> dic
     
     try:
         async with session.post(info_url, json={"url": youtube_url}, timeout=15) as r:
-            js = await r.json()
+            js = orjson.loads(await r.read())
             if not js.get("status"):
                 raise Exception(js.get("message", "Failed to fetch video info"))
             return decrypt_savetube_data(js["data"])
@@ -662,7 +779,7 @@ async def savetube_download(session: aiohttp.ClientSession, key: str, quality: s
     
     try:
         async with session.post(download_url, json=payload, timeout=20) as r:
-            js = await r.json()
+            js = orjson.loads(await r.read())
             if js.get("status") and js.get("data", {}).get("downloadUrl"):
                 return js["data"]["downloadUrl"]
             raise Exception(js.get("message", "Failed to get download URL"))
@@ -672,32 +789,41 @@ async def savetube_download(session: aiohttp.ClientSession, key: str, quality: s
 
 def choose_best_quality(decrypted: dict, media_type: str) -> str:
     if media_type == "video":
-        formats = decrypted.get("formats", [])
-        video_formats = [f for f in formats if f.get("type") == "video"]
-        if video_formats:
-            video_formats.sort(key=lambda x: x.get("height", 0), reverse=True)
-            return str(video_formats[0].get("height", DEFAULT_VIDEO_QUALITY))
-        return DEFAULT_VIDEO_QUALITY
+        wanted, field, default = "video", "height", DEFAULT_VIDEO_QUALITY
     else:
-        formats = decrypted.get("formats", [])
-        audio_formats = [f for f in formats if f.get("type") == "audio"]
-        if audio_formats:
-            audio_formats.sort(key=lambda x: x.get("bitrate", 0), reverse=True)
-            return str(audio_formats[0].get("bitrate", DEFAULT_AUDIO_QUALITY))
-        return DEFAULT_AUDIO_QUALITY
+        wanted, field, default = "audio", "bitrate", DEFAULT_AUDIO_QUALITY
+    
+    # Single pass for the maximum instead of filtering and sorting
+    best = 0
+    for f in decrypted.get("formats", ()):
+        if f.get("type") == wanted:
+            value = f.get(field) or 0
+            if value > best:
+                best = value
+    
+    return str(best) if best else default
+
+# Only what the cache-hit response needs
+CACHE_HIT_FIELDS = {
+    "_id": 0, "file_id": 1, "chat_id": 1, "msg_id": 1, "meta": 1,
+    "file_path": 1, "file_path_at": 1
+}
 
 async def get_cached_file(ytid: str, media_type: str) -> Optional[Dict]:
     cache_key = f"{ytid}:{media_type}"
     
-    if cache_key in IN_MEMORY_CACHE:
-        return IN_MEMORY_CACHE[cache_key]
-    
-    doc = await mongodb.cache.find_one({"ytid": ytid, "type": media_type})
+    doc = IN_MEMORY_CACHE.get(cache_key)
     if doc:
-        IN_MEMORY_CACHE[cache_key] = doc
         return doc
     
-    return None
+    async def load():
+        doc = await mongodb.cache.find_one({"ytid": ytid, "type": media_type}, CACHE_HIT_FIELDS)
+        if doc:
+            IN_MEMORY_CACHE[cache_key] = doc
+        return doc
+    
+    # Concurrent misses for one key share a single Mongo lookup, including a None result
+    return await coalesce(cache_key, load, CACHE_LOOKUPS)
 
 async def save_cache_record(ytid: str, media_type: str, file_id: str, 
                            chat_id: int, msg_id: int, file_name: str, meta: dict):
@@ -712,9 +838,10 @@ async def save_cache_record(ytid: str, media_type: str, file_id: str,
         "cached_at": datetime.datetime.utcnow()
     }
     
+    # A new file_id invalidates any path resolved for the old one
     await mongodb.cache.update_one(
         {"ytid": ytid, "type": media_type},
-        {"$set": doc},
+        {"$set": doc, "$unset": {"file_path": "", "file_path_at": ""}},
         upsert=True
     )
     
@@ -722,51 +849,95 @@ async def save_cache_record(ytid: str, media_type: str, file_id: str,
     IN_MEMORY_CACHE[cache_key] = doc
     return doc
 
-async def check_api_key(key: str):
-    if not key:
-        raise HTTPException(status_code=401, detail="API key required")
-    
-    record = await mongodb.apikeys.find_one({"key": key})
-    if not record:
-        raise HTTPException(status_code=401, detail="Invalid API key")
-    
+_BACKGROUND_TASKS = set()
+
+def spawn_background(coro):
+    # Keep a reference so the task isn't garbage-collected before it finishes
+    task = asyncio.create_task(coro)
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+    return task
+
+async def bump_daily_total(today: str):
+    # One small counter doc per day keeps dashboard totals O(1) to read
+    try:
+        await mongodb.daily_totals.update_one({"_id": today}, {"$inc": {"count": 1}}, upsert=True)
+    except Exception as e:
+        logger.error(f"Failed to update daily total for {today}: {e}")
+
+def _check_expiry(record: dict):
     expiry = record.get("expiry_date")
     if expiry:
         if isinstance(expiry, str):
             expiry = datetime.datetime.fromisoformat(expiry)
         if expiry < datetime.datetime.utcnow():
             raise HTTPException(status_code=403, detail="API key expired")
+
+async def check_api_key(key: str):
+    if not key:
+        raise HTTPException(status_code=401, detail="API key required")
     
     today = ist_date_str()
-    if record.get("last_used_date") != today:
-        await mongodb.apikeys.update_one(
-            {"key": key},
-            {"$set": {"used_today": 0, "last_used_date": today}}
-        )
-        record["used_today"] = 0
+    projection = {"used_today": 1, "daily_limit": 1, "expiry_date": 1, "is_admin": 1}
     
-    used = record.get("used_today", 0)
-    limit = record.get("daily_limit", 1000)
+    # Reset-on-new-day and increment in one atomic round-trip; the filter refuses
+    # the update once today's usage has reached the key's limit or the key has expired
+    record = await mongodb.apikeys.find_one_and_update(
+        {
+            "key": key,
+            "$and": [
+                {"$or": [
+                    {"last_used_date": {"$ne": today}, "$expr": {"$gt": [
+                        {"$ifNull": ["$daily_limit", 1000]}, 0
+                    ]}},
+                    {"$expr": {"$lt": [
+                        {"$ifNull": ["$used_today", 0]},
+                        {"$ifNull": ["$daily_limit", 1000]}
+                    ]}}
+                ]},
+                # Legacy ISO-string expiries still go through _check_expiry below
+                {"$or": [
+                    {"expiry_date": None},
+                    {"expiry_date": {"$gt": datetime.datetime.utcnow()}},
+                    {"expiry_date": {"$type": "string"}}
+                ]}
+            ]
+        },
+        [{"$set": {
+            "used_today": {"$cond": [
+                {"$ne": ["$last_used_date", today]},
+                1,
+                {"$add": [{"$ifNull": ["$used_today", 0]}, 1]}
+            ]},
+            "last_used_date": today
+        }}],
+        projection=projection,
+        return_document=ReturnDocument.AFTER
+    )
     
-    if used >= limit:
-        raise HTTPException(status_code=429, detail="Daily limit reached")
+    if record:
+        _check_expiry(record)
+        # Stats only: never let the counter fail or slow down an accepted request
+        spawn_background(bump_daily_total(today))
+        return record
     
-    await mongodb.apikeys.update_one(
-        {"key": key},
-        {"$inc": {"used_today": 1}}
-    )
+    # Slow path only on rejection: work out why the update did not match
+    record = await mongodb.apikeys.find_one({"key": key}, projection)
+    if not record:
+        raise HTTPException(status_code=401, detail="Invalid API key")
     
-    return record
+    _check_expiry(record)
+    raise HTTPException(status_code=429, detail="Daily limit reached")
 
-async def create_api_key(owner: str = "user", daily_limit: int = 1000, 
-                        days_valid: int = 30, is_admin: bool = False):
+def build_api_key_doc(owner: str = "user", daily_limit: int = 1000, 
+                      days_valid: int = 30, is_admin: bool = False) -> dict:
     key = secrets.token_urlsafe(32)
     expiry = None
     
     if days_valid:
         expiry = (datetime.datetime.utcnow() + datetime.timedelta(days=days_valid))
     
-    doc = {
+    return {
         "key": key,
         "owner": owner,
         "daily_limit": daily_limit,
@@ -776,117 +947,416 @@ async def create_api_key(owner: str = "user", daily_limit: int = 1000,
         "is_admin": is_admin,
         "created_at": datetime.datetime.utcnow()
     }
-    
-    await mongodb.apikeys.insert_one(doc)
+
+async def create_api_key(owner: str = "user", daily_limit: int = 1000, 
+                        days_valid: int = 30, is_admin: bool = False):
+    doc = build_api_key_doc(owner, daily_limit, days_valid, is_admin)
+    await apikeys_unjournaled.insert_one(doc)
     return doc
 
-async def download_file(session: aiohttp.ClientSession, url: str, dest_path: str):
-    async with session.get(url, timeout=300) as response:
+async def create_api_keys_bulk(specs: List[Dict[str, Any]]) -> List[Dict]:
+    docs = [build_api_key_doc(**spec) for spec in specs]
+    if docs:
+        await apikeys_unjournaled.insert_many(docs, ordered=False)
+    return docs
+
+DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+# No total cap for large transfers; a stalled connection is caught by sock_read instead.
+# An integer timeout= would replace this with a plain total limit.
+DOWNLOAD_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=60)
+PROGRESS_LOG_INTERVAL = 5.0
+SPOOL_MAX_SIZE = int(os.getenv("SPOOL_MAX_SIZE", str(64 * 1024 * 1024)))
+
+class NamedSpooledFile(tempfile.SpooledTemporaryFile):
+    # Pyrogram takes the upload's file name and mime type from .name
+    def __init__(self, name: str, max_size: int = SPOOL_MAX_SIZE):
+        super().__init__(max_size=max_size)
+        self._upload_name = name
+    
+    @property
+    def name(self):
+        return self._upload_name
+
+RANGE_MIN_SIZE = 8 * 1024 * 1024
+RANGE_PARTS = int(os.getenv("RANGE_PARTS", "4"))
+
+class DownloadProgress:
+    # Logs at every 10% across however many connections feed the file, or every
+    # PROGRESS_LOG_INTERVAL seconds when the size is unknown
+    def __init__(self, file_name: str, total_size: int):
+        self.file_name = file_name
+        self.total_size = total_size
+        self.downloaded = 0
+        self.step = max(total_size // 10, 1)
+        self.next_log_at = self.step
+        self.last_log = time.monotonic()
+    
+    def advance(self, n: int):
+        self.downloaded += n
+        if self.total_size > 0:
+            if self.downloaded < self.next_log_at:
+                return
+            while self.next_log_at <= self.downloaded:
+                self.next_log_at += self.step
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(f"Downloaded {self.downloaded * 100 / self.total_size:.1f}% of {self.file_name}")
+        else:
+            now = time.monotonic()
+            if now - self.last_log < PROGRESS_LOG_INTERVAL:
+                return
+            self.last_log = now
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(f"Downloaded {humanize.naturalsize(self.downloaded)} of {self.file_name}")
+
+def _write_at(f, offset: int, data: bytes):
+    f.seek(offset)
+    f.write(data)
+
+async def probe_range_size(session: aiohttp.ClientSession, url: str) -> int:
+    # Returns the full size when the server honours byte ranges, otherwise 0
+    try:
+        async with session.get(url, headers={"Range": "bytes=0-0"}, timeout=30) as r:
+            if r.status != 206:
+                return 0
+            total = r.headers.get("Content-Range", "").rpartition("/")[2]
+            return int(total) if total.isdigit() else 0
+    except Exception as e:
+        logger.warning(f"Range probe failed for {url}: {e}")
+        return 0
+
+async def _download_range(session: aiohttp.ClientSession, url: str, spool: NamedSpooledFile,
+                          start: int, end: int, total_size: int, write_lock: asyncio.Lock, 
+                          on_disk: bool, progress: DownloadProgress):
+    async with session.get(url, headers={"Range": f"bytes={start}-{end}"}, timeout=DOWNLOAD_TIMEOUT) as response:
+        if response.status != 206:
+            raise RuntimeError(f"Expected 206 for range {start}-{end}, got {response.status}")
+        content_range = response.headers.get("Content-Range", "")
+        if content_range != f"bytes {start}-{end}/{total_size}":
+            raise RuntimeError(f"Unexpected Content-Range for range {start}-{end}: {content_range!r}")
+        
+        offset = start
+        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+            # Never write past this part, or it would clobber the next one
+            if offset + len(chunk) > end + 1:
+                raise RuntimeError(f"Range {start}-{end} returned more data than requested")
+            # Parts share one file position, so each seek+write must not interleave
+            async with write_lock:
+                if on_disk:
+                    await asyncio.to_thread(_write_at, spool, offset, chunk)
+                else:
+                    _write_at(spool, offset, chunk)
+            offset += len(chunk)
+            progress.advance(len(chunk))
+        
+        # A short part would otherwise leave a silent gap in the file
+        if offset != end + 1:
+            raise RuntimeError(f"Range {start}-{end} ended early at {offset}")
+
+async def _download_ranges(session: aiohttp.ClientSession, url: str, 
+                           spool: NamedSpooledFile, total_size: int):
+    part_size = -(-total_size // RANGE_PARTS)
+    write_lock = asyncio.Lock()
+    on_disk = total_size > SPOOL_MAX_SIZE
+    if on_disk:
+        await asyncio.to_thread(spool.rollover)
+    progress = DownloadProgress(spool.name, total_size)
+    
+    # TaskGroup cancels the remaining parts if one fails; writes already running in a
+    # thread can still finish, so callers must not reuse this spool after a failure
+    async with asyncio.TaskGroup() as tg:
+        for start in range(0, total_size, part_size):
+            tg.create_task(_download_range(
+                session, url, spool, start, min(start + part_size, total_size) - 1, total_size,
+                write_lock, on_disk, progress
+            ))
+
+async def _download_stream(session: aiohttp.ClientSession, url: str, spool: NamedSpooledFile):
+    async with session.get(url, timeout=DOWNLOAD_TIMEOUT) as response:
         response.raise_for_status()
         total_size = int(response.headers.get('content-length', 0))
+        progress = DownloadProgress(spool.name, total_size)
+        on_disk = total_size > SPOOL_MAX_SIZE
+        if on_disk:
+            await asyncio.to_thread(spool.rollover)
         
-        with open(dest_path, 'wb') as f:
-            downloaded = 0
-            async for chunk in response.content.iter_chunked(1024 * 1024):
-                f.write(chunk)
-                downloaded += len(chunk)
-                
-                if total_size > 0:
-                    percent = (downloaded / total_size) * 100
-                    if int(percent) % 10 == 0:
-                        logger.info(f"Downloaded {percent:.1f}% of {dest_path}")
+        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+            if on_disk or progress.downloaded + len(chunk) > SPOOL_MAX_SIZE:
+                # Past the threshold the spool lives on disk, so keep the write off the loop
+                await asyncio.to_thread(spool.write, chunk)
+            else:
+                spool.write(chunk)
+            progress.advance(len(chunk))
 
-async def upload_to_telegram(file_path: str, title: str, media_type: str):
+async def download_to_spool(session: aiohttp.ClientSession, url: str, 
+                            file_name: str) -> NamedSpooledFile:
+    # Small files stay in memory; ones known to exceed SPOOL_MAX_SIZE go straight to a
+    # temp file, and ones of unknown size spill over once they cross it
+    
+    # Large files are fetched over several connections when the CDN supports ranges
+    total_size = await probe_range_size(session, url)
+    if total_size > RANGE_MIN_SIZE and RANGE_PARTS > 1:
+        spool = NamedSpooledFile(file_name)
+        try:
+            await _download_ranges(session, url, spool, total_size)
+            spool.seek(0)
+            return spool
+        except Exception as e:
+            logger.warning(f"Ranged download of {file_name} failed, retrying sequentially: {e}")
+            # A part write already handed to a thread may still land after cancellation,
+            # so abandon this spool and retry into a fresh one
+            spool.close()
+        except BaseException:
+            spool.close()
+            raise
+    
+    spool = NamedSpooledFile(file_name)
     try:
-        if media_type == "video":
-            sent_message = await pyrogram_client.send_video(
-                chat_id=CACHE_CHANNEL_ID,
-                video=file_path,
-                caption=title[:1000],
-                parse_mode=ParseMode.HTML
-            )
-            file_id = sent_message.video.file_id
-        else:
-            sent_message = await pyrogram_client.send_audio(
-                chat_id=CACHE_CHANNEL_ID,
-                audio=file_path,
-                caption=title[:1000],
-                parse_mode=ParseMode.HTML,
-                title=title[:64],
-                performer="YouTube"
-            )
-            file_id = sent_message.audio.file_id
+        await _download_stream(session, url, spool)
+        spool.seek(0)
+        return spool
+    except BaseException:
+        spool.close()
+        raise
+
+async def upload_to_telegram(file, title: str, media_type: str):
+    try:
+        match media_type:
+            case "video":
+                sent_message = await pyrogram_client.send_video(
+                    chat_id=CACHE_CHANNEL_ID,
+                    video=file,
+                    caption=title[:1000],
+                    parse_mode=ParseMode.HTML
+                )
+                file_id = sent_message.video.file_id
+            case _:
+                sent_message = await pyrogram_client.send_audio(
+                    chat_id=CACHE_CHANNEL_ID,
+                    audio=file,
+                    caption=title[:1000],
+                    parse_mode=ParseMode.HTML,
+                    title=title[:64],
+                    performer="YouTube"
+                )
+                file_id = sent_message.audio.file_id
         
         return file_id, sent_message.id
     except Exception as e:
         logger.error(f"Telegram upload failed: {e}")
         raise
 
+def evict_stale_processing():
+    # Drop markers left behind by tasks that finished without reaching their cleanup;
+    # live tasks keep theirs however long they wait on UPLOAD_SEM
+    for key, task in list(PROCESSING_TASKS.items()):
+        if task.done():
+            PROCESSING_SET.discard(key)
+            PROCESSING_TASKS.pop(key, None)
+            UPLOADING.pop(key, None)
+
 async def background_download_and_upload(ytid: str, media_type: str, 
                                         download_url: str, title: str, 
                                         quality: str, meta: dict):
     cache_key = f"{ytid}:{media_type}"
     
+    evict_stale_processing()
+    
     if cache_key in PROCESSING_SET:
         logger.info(f"Already processing {cache_key}, skipping")
         return
     
+    current = asyncio.current_task()
     PROCESSING_SET.add(cache_key)
+    PROCESSING_TASKS[cache_key] = current
     
     ext = "mp4" if media_type == "video" else "mp3"
     safe_title = sanitize_filename(title)[:100]
     filename = f"{ytid}_{media_type}_{quality}.{ext}"
-    filepath = os.path.join(DOWNLOAD_DIR, filename)
+    spool = None
     
-    session = aiohttp.ClientSession()
+    session = app.state.http
     
     try:
-        logger.info(f"Downloading {ytid} to {filepath}")
-        await download_file(session, download_url, filepath)
-        
-        logger.info(f"Uploading {filename} to Telegram")
-        file_id, msg_id = await upload_to_telegram(filepath, title, media_type)
-        
-        await save_cache_record(
-            ytid, media_type, file_id, 
-            CACHE_CHANNEL_ID, msg_id, filename, 
-            {"title": title, "quality": quality, **meta}
-        )
-        
-        logger.info(f"Cached {cache_key} as file_id {file_id}")
+        # Bound how many cache fills download and upload at once
+        async with UPLOAD_SEM:
+            logger.info(f"Downloading {ytid} as {filename}")
+            spool = await download_to_spool(session, download_url, filename)
+            
+            logger.info(f"Uploading {filename} to Telegram")
+            file_id, msg_id = await upload_to_telegram(spool, title, media_type)
+            
+            await save_cache_record(
+                ytid, media_type, file_id, 
+                CACHE_CHANNEL_ID, msg_id, filename, 
+                {"title": title, "quality": quality, **meta}
+            )
+            
+            logger.info(f"Cached {cache_key} as file_id {file_id}")
         
     except Exception as e:
         logger.error(f"Background task failed for {cache_key}: {e}")
     finally:
-        await session.close()
-        
-        try:
-            if os.path.exists(filepath):
-                os.remove(filepath)
-        except Exception as e:
-            logger.error(f"Failed to delete {filepath}: {e}")
+        if spool is not None:
+            # Closing a spool that spilled to disk frees the temp file's blocks; keep that off the loop
+            try:
+                await asyncio.to_thread(spool.close)
+            except Exception as e:
+                logger.error(f"Failed to close spool for {filename}: {e}")
         
-        PROCESSING_SET.discard(cache_key)
+        # Only clear markers this task still owns
+        if PROCESSING_TASKS.get(cache_key) is current:
+            PROCESSING_SET.discard(cache_key)
+            PROCESSING_TASKS.pop(cache_key, None)
+            UPLOADING.pop(cache_key, None)
 
-async def get_telegram_download_url(file_id: str) -> str:
+FILE_PATH_TTL = 1800
+_FILE_PATH_CACHE: TTLCache = TTLCache(maxsize=MEMORY_CACHE_SIZE, ttl=FILE_PATH_TTL)
+
+async def resolve_telegram_file_path(file_id: str) -> Optional[str]:
     try:
         file_info = await pyrogram_client.get_file(file_id)
-        return f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_info.file_path}"
+        return file_info.file_path
     except Exception as e:
         logger.error(f"Failed to get Telegram download URL: {e}")
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"https://api.telegram.org/bot{BOT_TOKEN}/getFile?file_id={file_id}"
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data.get("ok") and data.get("result", {}).get("file_path"):
-                            file_path = data["result"]["file_path"]
-                            return f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}"
+            session = app.state.http
+            url = f"https://api.telegram.org/bot{BOT_TOKEN}/getFile?file_id={file_id}"
+            async with session.get(url) as response:
+                if response.status != 200:
+                    logger.error(f"Fallback method also failed: HTTP {response.status}")
+                    return None
+                data = orjson.loads(await response.read())
+                if data.get("ok") and data.get("result", {}).get("file_path"):
+                    return data["result"]["file_path"]
         except Exception as e2:
-            logger.error(f"Fallback method also failed: {e2}")
+            # The request URL carries BOT_TOKEN, so never log the exception text
+            logger.error(f"Fallback method also failed: {type(e2).__name__}")
         
-        return f"https://api.telegram.org/bot{BOT_TOKEN}/getFile?file_id={file_id}"
+        return None
+
+async def store_file_path(file_id: str, file_path: str):
+    try:
+        await mongodb.cache.update_one(
+            {"file_id": file_id},
+            {"$set": {"file_path": file_path, "file_path_at": time.time()}}
+        )
+    except Exception as e:
+        logger.error(f"Failed to store file path for {file_id}: {e}")
+
+async def get_telegram_download_url(file_id: str, stored_path: Optional[str] = None, 
+                                    stored_at: float = 0.0) -> str:
+    # Telegram file paths stay valid for a while, so skip get_file when we have a fresh one
+    file_path = _FILE_PATH_CACHE.get(file_id)
+    if not file_path and stored_path and time.time() - stored_at < FILE_PATH_TTL:
+        file_path = _FILE_PATH_CACHE[file_id] = stored_path
+    
+    if not file_path:
+        file_path = await resolve_telegram_file_path(file_id)
+        if not file_path:
+            return f"https://api.telegram.org/bot{BOT_TOKEN}/getFile?file_id={file_id}"
+        
+        _FILE_PATH_CACHE[file_id] = file_path
+        # Persisting the path is an optimisation; don't fail or delay the request on it
+        spawn_background(store_file_path(file_id, file_path))
+    
+    return f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}"
+
+async def coalesce(key: str, factory, registry: Optional[Dict[str, asyncio.Future]] = None):
+    # Concurrent callers with the same key share the first caller's result (or error)
+    if registry is None:
+        registry = INFLIGHT
+    fut = registry.get(key)
+    if fut is not None:
+        return await asyncio.shield(fut)
+    
+    fut = asyncio.get_running_loop().create_future()
+    registry[key] = fut
+    try:
+        fut.set_result(await factory())
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except Exception as e:
+        fut.set_exception(e)
+    finally:
+        registry.pop(key, None)
+    
+    return fut.result()
+
+async def fetch_from_savetube(vidid: str, yt_url: str, media_type: str, 
+                             quality: Optional[str]) -> dict:
+    # While a previous miss is still being uploaded, hand out its SaveTube link
+    # instead of asking SaveTube again
+    cache_key = f"{vidid}:{media_type}"
+    pending = UPLOADING.get(cache_key)
+    if pending and (not quality or quality == pending["result"]["quality"]):
+        return pending
+    
+    session = app.state.http
+    
+    decrypted = await savetube_info(session, yt_url)
+    selected_quality = quality or choose_best_quality(decrypted, media_type)
+    download_url = await savetube_download(session, decrypted.get("key"), selected_quality, media_type)
+    
+    response_data = {
+        "status": True,
+        "result": {
+            "title": decrypted.get("title", "Unknown"),
+            "duration": decrypted.get("durationLabel", "Unknown"),
+            "quality": selected_quality,
+            "source": "savetube",
+            "url": download_url
+        }
+    }
+    
+    if cache_key not in PROCESSING_SET:
+        UPLOADING[cache_key] = response_data
+    
+    spawn_background(
+        background_download_and_upload(
+            vidid, media_type, download_url,
+            decrypted.get("title", vidid),
+            selected_quality,
+            {
+                "duration": decrypted.get("durationLabel", "Unknown"),
+                "thumbnail": decrypted.get("thumbnail")
+            }
+        )
+    )
+    
+    return response_data
+
+async def sum_today_usage(today: str) -> int:
+    doc = await mongodb.daily_totals.find_one({"_id": today})
+    return (doc or {}).get("count", 0)
+
+STATS_TTL = 30
+_STATS_CACHE: Dict[str, Any] = {"val": None, "exp": 0.0}
+_STATS_LOCK = asyncio.Lock()
+
+async def get_stats() -> Dict[str, int]:
+    # Dashboard numbers only need to be seconds-fresh, so share one result across requests
+    if time.monotonic() < _STATS_CACHE["exp"]:
+        return _STATS_CACHE["val"]
+    
+    async with _STATS_LOCK:
+        if time.monotonic() < _STATS_CACHE["exp"]:
+            return _STATS_CACHE["val"]
+        
+        total_downloads, total_users, today_usage = await asyncio.gather(
+            mongodb.cache.estimated_document_count(),
+            mongodb.apikeys.estimated_document_count(),
+            sum_today_usage(ist_date_str())
+        )
+        stats = {
+            "total_downloads": total_downloads,
+            "total_users": total_users,
+            "today_usage": today_usage
+        }
+        
+        _STATS_CACHE["val"] = stats
+        _STATS_CACHE["exp"] = time.monotonic() + STATS_TTL
+        return stats
 
 # -------------------
 # Website Routes
@@ -894,39 +1364,38 @@ async def get_telegram_download_url(file_id: str) -> str:
 @app.get("/", response_class=HTMLResponse)
 async def home_page(request: Request, user: dict = Depends(get_current_user)):
     # Get real stats
-    total_downloads = await mongodb.cache.count_documents({})
-    total_users = await mongodb.apikeys.count_documents({})
-    today_usage = 0
-    
-    today = ist_date_str()
-    users_today = await mongodb.apikeys.find({"last_used_date": today}).to_list(None)
-    for u in users_today:
-        today_usage += u.get("used_today", 0)
+    stats = await get_stats()
     
     return templates.TemplateResponse("index.html", {
         "request": request,
         "user": user,
-        "stats": {
-            "total_downloads": total_downloads,
-            "total_users": total_users,
-            "today_usage": today_usage
-        }
+        "stats": stats
     })
 
 @app.get("/api/stats")
-async def api_stats():
-    total_downloads = await mongodb.cache.count_documents({})
-    today_usage = 0
+async def api_stats(request: Request):
+    stats = await get_stats()
     
-    today = ist_date_str()
-    users_today = await mongodb.apikeys.find({"last_used_date": today}).to_list(None)
-    for u in users_today:
-        today_usage += u.get("used_today", 0)
+    # Only the cached values, so the ETag stays stable for the whole cache window
+    body = orjson.dumps({
+        "total_downloads": stats["total_downloads"],
+        "today_usage": stats["today_usage"]
+    })
     
-    return {
-        "total_downloads": total_downloads,
-        "today_usage": today_usage
+    headers = {
+        "Cache-Control": "public, max-age=15, stale-while-revalidate=30",
+        "ETag": f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
     }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Only what the admin user table renders
+ADMIN_USER_FIELDS = {
+    "key": 1, "owner": 1, "created_at": 1, "daily_limit": 1,
+    "used_today": 1, "is_admin": 1, "last_used_date": 1
+}
 
 @app.get("/admin", response_class=HTMLResponse)
 async def admin_panel(request: Request, admin: dict = Depends(get_current_admin)):
@@ -934,20 +1403,17 @@ async def admin_panel(request: Request, admin: dict = Depends(get_current_admin)
         return RedirectResponse(url="/login")
     
     # Get real statistics
-    total_users = await mongodb.apikeys.count_documents({})
-    total_cached = await mongodb.cache.count_documents({})
     today = ist_date_str()
-    
-    today_usage = 0
-    users_today = await mongodb.apikeys.find({"last_used_date": today}).to_list(None)
-    for user in users_today:
-        today_usage += user.get("used_today", 0)
+    total_users, total_cached, today_usage, users = await asyncio.gather(
+        mongodb.apikeys.estimated_document_count(),
+        mongodb.cache.estimated_document_count(),
+        sum_today_usage(today),
+        mongodb.apikeys.find({}, ADMIN_USER_FIELDS).sort("created_at", -1).limit(20).to_list(None)
+    )
     
     # Calculate storage used (approximate)
     storage_used = total_cached * 10  # Approximate 10MB per file
     
-    users = await mongodb.apikeys.find().sort("created_at", -1).limit(20).to_list(None)
-    
     return templates.TemplateResponse("admin.html", {
         "request": request,
         "user": admin,
@@ -970,11 +1436,29 @@ async def admin_create_key_api(request: Request, admin: dict = Depends(get_curre
     daily_limit = int(form.get("daily_limit", 1000))
     days_valid = int(form.get("days_valid", 30))
     is_admin = form.get("is_admin") == "on"
+    count = int(form.get("count") or 1)
+    
+    if count > 1:
+        spec = {"owner": owner, "daily_limit": daily_limit, 
+                "days_valid": days_valid, "is_admin": is_admin}
+        docs = await create_api_keys_bulk([spec] * min(count, 1000))
+        return {"success": True, "keys": [d["key"] for d in docs]}
     
     key_data = await create_api_key(owner, daily_limit, days_valid, is_admin)
     
     return {"success": True, "key": key_data["key"]}
 
+@app.get("/admin/api/stats")
+async def admin_api_stats(admin: dict = Depends(get_current_admin)):
+    if not admin:
+        raise HTTPException(status_code=401, detail="Admin access required")
+    
+    # Live process counters, never cached
+    return {
+        "memory_cache_size": len(IN_MEMORY_CACHE),
+        "processing": len(PROCESSING_SET)
+    }
+
 @app.delete("/admin/user/{api_key}")
 async def delete_user_api(api_key: str, admin: dict = Depends(get_current_admin)):
     if not admin:
@@ -989,23 +1473,86 @@ async def delete_user_api(api_key: str, admin: dict = Depends(get_current_admin)
 # -------------------
 # API endpoints
 # -------------------
+API_CREATOR = "@Nottyboyy"
+API_TELEGRAM = "https://t.me/ZeeMusicUpdate"
+
 class ResultModel(BaseModel):
     status: bool
-    creator: str = "@Nottyboyy"
-    telegram: str = "https://t.me/ZeeMusicUpdate"
+    creator: str = API_CREATOR
+    telegram: str = API_TELEGRAM
     result: Optional[dict] = None
     message: Optional[str] = None
 
+def result_response(result: dict) -> ORJSONResponse:
+    # Same shape as ResultModel, returned directly to skip response-model validation
+    return ORJSONResponse(content={
+        "status": True,
+        "creator": API_CREATOR,
+        "telegram": API_TELEGRAM,
+        "result": result,
+        "message": None
+    })
+
+async def ensure_unique_cache_index():
+    # Older deployments built (ytid, type) without the unique flag; migrate them
+    indexes = await mongodb.cache.index_information()
+    existing = indexes.get("ytid_1_type_1")
+    if existing and not existing.get("unique"):
+        # Keep the newest record of each (ytid, type) so the unique build can succeed
+        duplicates = mongodb.cache.aggregate([
+            {"$sort": {"cached_at": -1}},
+            {"$group": {"_id": {"ytid": "$ytid", "type": "$type"}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}}
+        ], allowDiskUse=True)
+        removed = 0
+        async for group in duplicates:
+            result = await mongodb.cache.delete_many({"_id": {"$in": group["ids"][1:]}})
+            removed += result.deleted_count
+        if removed:
+            logger.warning(f"Removed {removed} duplicate cache records before building unique index")
+        
+        await mongodb.cache.drop_index("ytid_1_type_1")
+        logger.info("Rebuilding cache (ytid, type) index as unique")
+    await mongodb.cache.create_index([("ytid", 1), ("type", 1)], unique=True)
+
 @app.on_event("startup")
 async def startup_event():
-    await mongodb.cache.create_index("ytid")
-    await mongodb.cache.create_index([("ytid", 1), ("type", 1)])
-    await mongodb.apikeys.create_index("key", unique=True)
+    create_premium_templates()
+    warm_templates()
+    
+    # One pooled session for the whole app so SaveTube/Telegram calls reuse connections
+    # and a single SSLContext so TLS settings are built once and sessions can resume
+    ssl_ctx = ssl.create_default_context()
+    ssl_ctx.set_alpn_protocols(["http/1.1"])
+    app.state.http = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            ssl=ssl_ctx,
+            limit=200,
+            limit_per_host=64,
+            use_dns_cache=True,
+            ttl_dns_cache=300,
+            keepalive_timeout=75
+        ),
+        timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=60),
+        json_serialize=lambda obj: orjson.dumps(obj).decode()
+    )
+    
+    # (ytid, type) also serves ytid-only lookups, so the old single-field index is redundant
+    try:
+        await mongodb.cache.drop_index("ytid_1")
+    except OperationFailure:
+        pass
+    await ensure_unique_cache_index()
+    await mongodb.cache.create_index("file_id")
+    await mongodb.apikeys.create_indexes([
+        IndexModel([("key", 1)], unique=True),
+        IndexModel([("created_at", -1)])
+    ])
     
     await pyrogram_client.start()
     logger.info("Pyrogram client started")
     
-    count = await mongodb.apikeys.count_documents({})
+    count = await mongodb.apikeys.estimated_document_count()
     if count == 0:
         key_data = await create_api_key("admin", 10000, 365, True)
         logger.info(f"Created default admin key: {key_data['key']}")
@@ -1014,87 +1561,69 @@ async def startup_event():
 async def shutdown_event():
     await pyrogram_client.stop()
     logger.info("Pyrogram client stopped")
+    
+    await app.state.http.close()
 
-@app.get("/ytmp4", response_model=ResultModel)
-async def ytmp4(
-    request: Request,
-    url: str = Query(..., description="YouTube URL or video ID"),
-    api_key: str = Query(..., description="Your API key"),
-    quality: str = Query(None, description="Preferred quality (e.g., 720, 1080)")
-):
+ENDPOINT_NAMES = {"video": "YTMP4", "audio": "YTMP3"}
+
+async def _build_cache_response(cached: dict) -> ORJSONResponse:
+    telegram_url = await get_telegram_download_url(
+        cached["file_id"], cached.get("file_path"), cached.get("file_path_at", 0.0)
+    )
+    tlink = f"https://t.me/c/{str(cached['chat_id']).replace('-100', '')}/{cached['msg_id']}"
+    
+    return result_response({
+        "title": cached["meta"].get("title", "Unknown"),
+        "duration": cached["meta"].get("duration", "Unknown"),
+        "quality": cached["meta"].get("quality", "Unknown"),
+        "source": "telegram_cache",
+        "url": telegram_url,
+        "file_id": cached["file_id"],
+        "telegram_msg": {
+            "chat_id": cached["chat_id"],
+            "msg_id": cached["msg_id"],
+            "tlink": tlink
+        }
+    })
+
+async def _serve(media_type: str, url: str, api_key: str, quality: Optional[str]):
     await check_api_key(api_key)
     
     yt_url = normalize_youtube_input(url)
-    vidid = extract_vidid(url) or extract_vidid(yt_url)
+    vidid = extract_vidid(url)
     
     if not vidid:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=400,
             content={"status": False, "message": "Invalid YouTube URL or ID"}
         )
     
-    cached = await get_cached_file(vidid, "video")
+    cached = await get_cached_file(vidid, media_type)
     if cached:
-        telegram_url = await get_telegram_download_url(cached["file_id"])
-        tlink = f"https://t.me/c/{str(cached['chat_id']).replace('-100', '')}/{cached['msg_id']}"
-        
-        return {
-            "status": True,
-            "result": {
-                "title": cached["meta"].get("title", "Unknown"),
-                "duration": cached["meta"].get("duration", "Unknown"),
-                "quality": cached["meta"].get("quality", "Unknown"),
-                "source": "telegram_cache",
-                "url": telegram_url,
-                "file_id": cached["file_id"],
-                "telegram_msg": {
-                    "chat_id": cached["chat_id"],
-                    "msg_id": cached["msg_id"],
-                    "tlink": tlink
-                }
-            }
-        }
-    
-    session = aiohttp.ClientSession()
+        return await _build_cache_response(cached)
     
     try:
-        decrypted = await savetube_info(session, yt_url)
-        selected_quality = quality or choose_best_quality(decrypted, "video")
-        download_url = await savetube_download(session, decrypted.get("key"), selected_quality, "video")
-        
-        response_data = {
-            "status": True,
-            "result": {
-                "title": decrypted.get("title", "Unknown"),
-                "duration": decrypted.get("durationLabel", "Unknown"),
-                "quality": selected_quality,
-                "source": "savetube",
-                "url": download_url
-            }
-        }
-        
-        asyncio.create_task(
-            background_download_and_upload(
-                vidid, "video", download_url,
-                decrypted.get("title", vidid),
-                selected_quality,
-                {
-                    "duration": decrypted.get("durationLabel", "Unknown"),
-                    "thumbnail": decrypted.get("thumbnail")
-                }
-            )
+        response_data = await coalesce(
+            f"{vidid}:{media_type}:{quality or ''}",
+            lambda: fetch_from_savetube(vidid, yt_url, media_type, quality)
         )
-        
-        return response_data
+        return result_response(response_data["result"])
         
     except Exception as e:
-        logger.error(f"YTMP4 error: {e}")
-        return JSONResponse(
+        logger.error(f"{ENDPOINT_NAMES[media_type]} error: {e}")
+        return ORJSONResponse(
             status_code=500,
             content={"status": False, "message": str(e)}
         )
-    finally:
-        await session.close()
+
+@app.get("/ytmp4", response_model=ResultModel)
+async def ytmp4(
+    request: Request,
+    url: str = Query(..., description="YouTube URL or video ID"),
+    api_key: str = Query(..., description="Your API key"),
+    quality: str = Query(None, description="Preferred quality (e.g., 720, 1080)")
+):
+    return await _serve("video", url, api_key, quality)
 
 @app.get("/ytmp3", response_model=ResultModel)
 async def ytmp3(
@@ -1103,81 +1632,18 @@ async def ytmp3(
     api_key: str = Query(..., description="Your API key"),
     quality: str = Query(None, description="Preferred quality (e.g., 128, 320)")
 ):
-    await check_api_key(api_key)
-    
-    yt_url = normalize_youtube_input(url)
-    vidid = extract_vidid(url) or extract_vidid(yt_url)
-    
-    if not vidid:
-        return JSONResponse(
-            status_code=400,
-            content={"status": False, "message": "Invalid YouTube URL or ID"}
-        )
-    
-    cached = await get_cached_file(vidid, "audio")
-    if cached:
-        telegram_url = await get_telegram_download_url(cached["file_id"])
-        tlink = f"https://t.me/c/{str(cached['chat_id']).replace('-100', '')}/{cached['msg_id']}"
-        
-        return {
-            "status": True,
-            "result": {
-                "title": cached["meta"].get("title", "Unknown"),
-                "duration": cached["meta"].get("duration", "Unknown"),
-                "quality": cached["meta"].get("quality", "Unknown"),
-                "source": "telegram_cache",
-                "url": telegram_url,
-                "file_id": cached["file_id"],
-                "telegram_msg": {
-                    "chat_id": cached["chat_id"],
-                    "msg_id": cached["msg_id"],
-                    "tlink": tlink
-                }
-            }
-        }
-    
-    session = aiohttp.ClientSession()
-    
-    try:
-        decrypted = await savetube_info(session, yt_url)
-        selected_quality = quality or choose_best_quality(decrypted, "audio")
-        download_url = await savetube_download(session, decrypted.get("key"), selected_quality, "audio")
-        
-        response_data = {
-            "status": True,
-            "result": {
-                "title": decrypted.get("title", "Unknown"),
-                "duration": decrypted.get("durationLabel", "Unknown"),
-                "quality": selected_quality,
-                "source": "savetube",
-                "url": download_url
-            }
-        }
-        
-        asyncio.create_task(
-            background_download_and_upload(
-                vidid, "audio", download_url,
-                decrypted.get("title", vidid),
-                selected_quality,
-                {
-                    "duration": decrypted.get("durationLabel", "Unknown"),
-                    "thumbnail": decrypted.get("thumbnail")
-                }
-            )
-        )
-        
-        return response_data
-        
-    except Exception as e:
-        logger.error(f"YTMP3 error: {e}")
-        return JSONResponse(
-            status_code=500,
-            content={"status": False, "message": str(e)}
-        )
-    finally:
-        await session.close()
+    return await _serve("audio", url, api_key, quality)
 
 if __name__ == "__main__":
     import uvicorn
+    import sys
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # uvloop isn't available on Windows; fall back to the default asyncio loop there
+    uvicorn.run(
+        "N:app",
+        host="0.0.0.0",
+        port=port,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        workers=int(os.environ.get("WEB_CONCURRENCY", "2"))
+    )